@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from agent.llm import LLM
-from agent.memory_manager import MemoryManager
+from agent.memory_manager import MemoryManager, THINK_PREFIX, TOOL_CALL_PREFIX, TOOL_RESULT_PREFIX
 from agent.tool_manager import ToolManager
 from typing import Any, Dict, List, Optional
 import asyncio
@@ -161,8 +161,8 @@ ACT: 工具名称 参数1 参数2 ...
         while iteration < self.max_iterations:
             iteration += 1
             
-            # 获取当前对话历史
-            messages = self.memory_manager.get_all()
+            # 获取当前对话上下文（长期记忆模式下只包含相关的历史消息）
+            messages = self.memory_manager.get_context(prompt)
             
             try:
                 # 调用LLM进行思考
@@ -175,7 +175,7 @@ ACT: 工具名称 参数1 参数2 ...
                 if parsed["think"]:
                     self.memory_manager.add({
                         "role": "assistant", 
-                        "content": f"THINK: {parsed['think']}"
+                        "content": f"{THINK_PREFIX} {parsed['think']}"
                     })
                 
                 # 如果没有工具调用，直接返回回复
@@ -198,11 +198,11 @@ ACT: 工具名称 参数1 参数2 ...
                     # 添加工具调用和结果到记忆
                     self.memory_manager.add({
                         "role": "assistant", 
-                        "content": f"ACT: {parsed['act']}"
+                        "content": f"{TOOL_CALL_PREFIX} {parsed['act']}"
                     })
                     self.memory_manager.add({
                         "role": "user", 
-                        "content": f"工具执行结果: {tool_result}"
+                        "content": f"{TOOL_RESULT_PREFIX} {tool_result}"
                     })
                     
                     # 如果这是最后一次迭代，返回工具结果
@@ -8,23 +8,28 @@ class LLM:
         self.stream = stream
         openai.api_key = api_key
 
+    def _stream_deltas(self, messages, **kwargs):
+        """同步地逐个产出流式响应中的文本片段"""
+        response = openai.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            **kwargs
+        )
+        for chunk in response:
+            delta = getattr(chunk.choices[0].delta, 'content', None)
+            if delta:
+                yield delta
+
     async def chat(self, messages, stream=None, **kwargs):
         if stream is None:
             stream = self.stream
         loop = asyncio.get_event_loop()
         if stream:
             def stream_request():
-                response = openai.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    stream=True,
-                    **kwargs
-                )
                 content = ""
-                for chunk in response:
-                    delta = getattr(chunk.choices[0].delta, 'content', None)
-                    if delta:
-                        content += delta
+                for delta in self._stream_deltas(messages, **kwargs):
+                    content += delta
                 return content
             content = await loop.run_in_executor(None, stream_request)
             return content
@@ -1,4 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
+from bisect import bisect_left
+import heapq
+import math
+import re
 
 class MemoryManager(BaseModel):
     memory: list = []
@@ -9,5 +13,166 @@ class MemoryManager(BaseModel):
     def get_all(self):
         return self.memory
 
+    def get_context(self, query: str):
+        """获取发送给LLM的上下文，默认返回完整历史"""
+        return self.get_all()
+
     def clear(self):
         self.memory = []
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+|[一-鿿]+")
+
+
+def tokenize(text: str) -> list:
+    """分词：英文/数字按单词切分，中文按相邻二字切分"""
+    tokens = []
+    for word in _TOKEN_RE.findall(text.lower()):
+        if word[0] >= "一":
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+# ToolCallingAgent 写入记忆的消息前缀，agent.py 引用这里的定义；
+# 它们几乎出现在所有消息中，不参与检索
+THINK_PREFIX = "THINK:"
+TOOL_CALL_PREFIX = "ACT:"
+TOOL_RESULT_PREFIX = "工具执行结果:"
+STOPWORDS = frozenset(tokenize(f"{THINK_PREFIX} {TOOL_CALL_PREFIX} {TOOL_RESULT_PREFIX} 工具 执行结果"))
+
+
+def _is_tool_call(item) -> bool:
+    return item.get("role") == "assistant" and str(item.get("content", "")).startswith(TOOL_CALL_PREFIX)
+
+
+def _is_tool_result(item) -> bool:
+    return item.get("role") == "user" and str(item.get("content", "")).startswith(TOOL_RESULT_PREFIX)
+
+
+class RetrievalMemoryManager(MemoryManager):
+    """基于BM25检索的长期记忆
+
+    每条消息在add时增量建立倒排索引；get_context只返回系统提示词、
+    本轮的用户问题、最近的若干条消息以及与当前问题最相关的top_k条较早消息。
+    工具调用（ACT）与其执行结果总是成对返回。
+
+    为保证查询耗时有上界，每个查询词只对截止位置之前最近的
+    max_postings 条倒排记录打分；低频词不受影响，高频词偏向较近的消息。
+    """
+
+    recent_messages: int = 6
+    top_k: int = 4
+    k1: float = 1.5
+    b: float = 0.75
+    max_postings: int = 128
+
+    # 词 -> ([消息下标（递增）], [词频])
+    _postings: dict = PrivateAttr(default_factory=dict)
+    _doc_lengths: dict = PrivateAttr(default_factory=dict)
+    _total_length: int = PrivateAttr(default=0)
+    _system: list = PrivateAttr(default_factory=list)
+
+    def model_post_init(self, __context):
+        # 为构造时传入的已有记忆（如会话交接）建立索引
+        for index, item in enumerate(self.memory):
+            self._index(index, item)
+
+    def _index(self, index: int, item):
+        if item.get("role") == "system":
+            self._system.append(index)
+            return
+        tokens = tokenize(str(item.get("content", "")))
+        if not tokens:
+            return
+        counts = {}
+        for token in tokens:
+            if token not in STOPWORDS:
+                counts[token] = counts.get(token, 0) + 1
+        postings = self._postings
+        for token, tf in counts.items():
+            entry = postings.get(token)
+            if entry is None:
+                postings[token] = ([index], [tf])
+            else:
+                entry[0].append(index)
+                entry[1].append(tf)
+        self._doc_lengths[index] = len(tokens)
+        self._total_length += len(tokens)
+
+    def add(self, item):
+        super().add(item)
+        self._index(len(self.memory) - 1, item)
+
+    def search(self, query: str, before: int = None, top_k: int = None) -> list:
+        """返回与query最相关的消息下标（按得分降序），只考虑下标小于before的消息"""
+        if top_k is None:
+            top_k = self.top_k
+        if before is None:
+            before = len(self.memory)
+        doc_count = len(self._doc_lengths)
+        if not doc_count or top_k <= 0:
+            return []
+        # 热循环中避免反复访问pydantic的私有属性
+        all_postings = self._postings
+        doc_lengths = self._doc_lengths
+        max_postings = self.max_postings
+        k1, b = self.k1, self.b
+        length_scale = k1 * b * doc_count / self._total_length
+        base = k1 * (1 - b)
+        scores = {}
+        for token in set(tokenize(query)) - STOPWORDS:
+            entry = all_postings.get(token)
+            if entry is None:
+                continue
+            indices, tfs = entry
+            df = len(indices)
+            # 倒排记录按下标递增，二分找到截止位置
+            end = bisect_left(indices, before)
+            start = max(end - max_postings, 0)
+            weight = math.log((doc_count - df + 0.5) / (df + 0.5) + 1) * (k1 + 1)
+            for index, tf in zip(indices[start:end], tfs[start:end]):
+                norm = base + length_scale * doc_lengths[index]
+                scores[index] = scores.get(index, 0.0) + weight * tf / (tf + norm)
+        return heapq.nlargest(top_k, scores, key=scores.get)
+
+    def _current_prompt_index(self):
+        """最近一条不是工具执行结果的用户消息，即本轮运行的用户问题"""
+        memory = self.memory
+        for index in range(len(memory) - 1, -1, -1):
+            item = memory[index]
+            if item.get("role") == "user" and not _is_tool_result(item):
+                return index
+        return None
+
+    def get_context(self, query: str):
+        """系统提示词 + 本轮的用户问题 + 相关的较早消息（保持原有顺序）+ 最近的消息"""
+        memory = self.memory
+        cutoff = max(len(memory) - self.recent_messages, 0)
+        # 最近消息以工具执行结果开头时，把对应的工具调用一起纳入
+        if 0 < cutoff < len(memory) and _is_tool_result(memory[cutoff]) and _is_tool_call(memory[cutoff - 1]):
+            cutoff -= 1
+        selected = set(i for i in self._system if i < cutoff)
+        # 无论检索结果如何，都保留发起本轮运行的用户问题
+        current = self._current_prompt_index()
+        if current is not None and current < cutoff:
+            selected.add(current)
+        for index in self.search(query, before=cutoff):
+            selected.add(index)
+            if _is_tool_call(memory[index]) and index + 1 < cutoff and _is_tool_result(memory[index + 1]):
+                selected.add(index + 1)
+            elif _is_tool_result(memory[index]) and index > 0 and _is_tool_call(memory[index - 1]):
+                selected.add(index - 1)
+        older = [memory[i] for i in sorted(selected)]
+        return older + memory[cutoff:]
+
+    def clear(self):
+        super().clear()
+        self._postings = {}
+        self._doc_lengths = {}
+        self._total_length = 0
+        self._system = []
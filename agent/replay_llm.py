@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from agent.llm import LLM
+
+
+def request_key(model: str, messages, kwargs: dict) -> str:
+    """计算一次chat请求的哈希，作为录制带中的查找键"""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "kwargs": kwargs},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class Cassette:
+    """录制带文件，每行一次交互：`<请求哈希>\\t<JSON>`
+
+    加载时只读取每行开头的哈希并记录文件偏移，不解析JSON，
+    因此内存中只保存索引；回放时按偏移读取单行，查找为O(1)。
+    相同请求被多次录制时，按录制顺序依次回放，最后一条重复使用。
+
+    录制时只追加到第一个文件，每个录制带文件同一时间只能有一个写入者
+    （例如多进程录制时每个工作进程使用各自的录制带）。
+    """
+
+    def __init__(self, paths):
+        if isinstance(paths, str):
+            paths = [paths]
+        self.paths = list(paths)
+        self.index = {}
+        self.cursors = {}
+        self._files = []
+        for file_id, path in enumerate(self.paths):
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                f = None
+            self._files.append(f)
+            if f is not None:
+                self._build_index(file_id, f)
+
+    def _build_index(self, file_id: int, f):
+        offset = 0
+        for line in f:
+            key, sep, _ = line.partition(b"\t")
+            if sep and line.endswith(b"\n"):
+                self.index.setdefault(key.decode("ascii"), []).append((file_id, offset))
+            offset += len(line)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.index.values())
+
+    def __contains__(self, key: str):
+        return key in self.index
+
+    def get(self, key: str) -> dict:
+        """按请求哈希取出下一条录制的交互"""
+        entries = self.index.get(key)
+        if not entries:
+            raise KeyError(f"录制带中没有该请求: {key}")
+        cursor = self.cursors.get(key, 0)
+        self.cursors[key] = cursor + 1
+        file_id, offset = entries[min(cursor, len(entries) - 1)]
+        f = self._files[file_id]
+        f.seek(offset)
+        _, _, data = f.readline().partition(b"\t")
+        return json.loads(data)
+
+    def append(self, key: str, record: dict):
+        """把一条交互追加到第一个录制带文件，并更新索引"""
+        data = json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str)
+        line = f"{key}\t{data}\n".encode("utf-8")
+        with open(self.paths[0], "a+b") as out:
+            self._truncate_partial_line(out)
+            out.write(line)
+            out.flush()
+            # 以写入后的实际位置计算偏移
+            offset = out.tell() - len(line)
+        if self._files[0] is None:
+            self._files[0] = open(self.paths[0], "rb")
+        self.index.setdefault(key, []).append((0, offset))
+
+    @staticmethod
+    def _truncate_partial_line(out, block_size: int = 65536):
+        """截掉文件末尾未写完的行（如写入中途崩溃），避免新记录与其拼接"""
+        end = out.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        out.seek(end - 1)
+        if out.read(1) == b"\n":
+            return
+        valid = 0
+        pos = end
+        while pos > 0:
+            start = max(pos - block_size, 0)
+            out.seek(start)
+            newline = out.read(pos - start).rfind(b"\n")
+            if newline >= 0:
+                valid = start + newline + 1
+                break
+            pos = start
+        out.truncate(valid)
+
+    def close(self):
+        for f in self._files:
+            if f is not None:
+                f.close()
+        self._files = [None] * len(self.paths)
+
+
+def split_chunks(record: dict) -> list:
+    """按录制的分块长度把响应还原为 [间隔毫秒, 文本片段] 列表"""
+    response = record["response"] or ""
+    chunks = []
+    start = 0
+    for delay_ms, length in record["chunks"]:
+        chunks.append([delay_ms, response[start:start + length]])
+        start += length
+    return chunks
+
+
+class ReplayLLM(LLM):
+    """可录制/回放的LLM，用于无网络环境下的确定性压测和回归测试
+
+    - mode="record"：调用真实的LLM，并把请求、参数、响应和流式分块时间写入录制带
+    - mode="replay"：按请求哈希从录制带返回响应，不访问网络
+    - realtime=True：回放时按录制的分块时间等待，模拟真实延迟
+    """
+
+    def __init__(
+        self,
+        cassette,
+        mode: str = "replay",
+        api_key: str = "",
+        model: str = "gpt-3.5-turbo",
+        stream: bool = True,
+        realtime: bool = False
+    ):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"未知模式: {mode}")
+        if mode == "record":
+            super().__init__(api_key=api_key, model=model, stream=stream)
+        else:
+            # 回放不访问网络，不修改全局的 openai.api_key，避免影响同进程中的真实LLM
+            self.api_key = api_key
+            self.model = model
+            self.stream = stream
+        self.mode = mode
+        self.realtime = realtime
+        self.cassette = cassette if isinstance(cassette, Cassette) else Cassette(cassette)
+
+    async def chat(self, messages, stream=None, **kwargs):
+        if stream is None:
+            stream = self.stream
+        key = request_key(self.model, messages, kwargs)
+        if self.mode == "replay":
+            return await self._replay(key, stream)
+        return await self._record(key, messages, stream, **kwargs)
+
+    async def _replay(self, key: str, stream: bool) -> str:
+        record = self.cassette.get(key)
+        if self.realtime:
+            # chunks 中保存的是 [相对上一分块的间隔（毫秒）, 分块长度]
+            delays = [delay_ms for delay_ms, _ in record["chunks"]]
+            if stream:
+                for delay_ms in delays:
+                    await asyncio.sleep(delay_ms / 1000)
+            else:
+                # 非流式只关心总耗时
+                await asyncio.sleep(sum(delays) / 1000)
+        return record["response"]
+
+    async def _record(self, key: str, messages, stream: bool, **kwargs) -> str:
+        # 先固定请求内容，Agent在等待期间可能继续修改消息列表
+        snapshot = json.loads(json.dumps(messages, ensure_ascii=False, default=str))
+        loop = asyncio.get_event_loop()
+        if stream:
+            def stream_request():
+                chunks = []
+                last = time.perf_counter()
+                deltas = []
+                for delta in self._stream_deltas(messages, **kwargs):
+                    now = time.perf_counter()
+                    chunks.append([round((now - last) * 1000, 1), len(delta)])
+                    deltas.append(delta)
+                    last = now
+                return "".join(deltas), chunks
+            response, chunks = await loop.run_in_executor(None, stream_request)
+        else:
+            start = time.perf_counter()
+            response = await super().chat(messages, stream=False, **kwargs)
+            chunks = [[round((time.perf_counter() - start) * 1000, 1), len(response or "")]]
+        self.cassette.append(key, {
+            "model": self.model,
+            "messages": snapshot,
+            "kwargs": kwargs,
+            "stream": stream,
+            "response": response,
+            "chunks": chunks
+        })
+        return response
@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import itertools
+import multiprocessing
+import threading
+
+from agent.memory_manager import MemoryManager
+from api.worker import default_agent_factory, worker_main
+from logger import get_logger
+
+logger = get_logger()
+
+
+class _WorkerHandle:
+    """调度器一侧对单个工作进程的记录"""
+
+    def __init__(self, index: int, process, conn, restarts: int = 0):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.restarts = restarts
+        self.pending = {}
+        self.closed = False
+        self.in_flight = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.reader = None
+
+
+class SessionDispatcher:
+    """多进程会话调度器
+
+    特点：
+    - 按会话ID哈希到固定的工作进程，同一会话的记忆始终保存在同一进程中
+    - 支持重启单个工作进程，并把其会话记忆交接给新进程
+    - 汇报每个工作进程的负载
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        agent_factory=default_agent_factory,
+        memory_factory=MemoryManager,
+        max_sessions: int = None,
+        control_timeout: float = 10.0,
+        start_method: str = "spawn"
+    ):
+        if num_workers < 1:
+            raise ValueError("num_workers 必须大于等于 1")
+        self.num_workers = num_workers
+        self.agent_factory = agent_factory
+        self.memory_factory = memory_factory
+        self.max_sessions = max_sessions
+        # 等待空闲、导出会话、查询负载、停止进程的超时（秒），防止卡死的工作进程拖住调度器
+        self.control_timeout = control_timeout
+        self.ctx = multiprocessing.get_context(start_method)
+        self.workers = []
+        self._ready = []
+        self._restart_locks = []
+        self._ids = itertools.count()
+        self._loop = None
+
+    def worker_index(self, session_id: str) -> int:
+        """计算会话对应的工作进程编号（跨进程、跨重启稳定）"""
+        digest = hashlib.blake2b(session_id.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.num_workers
+
+    async def start(self):
+        """启动所有工作进程"""
+        self._loop = asyncio.get_running_loop()
+        for index in range(self.num_workers):
+            self.workers.append(self._spawn(index))
+            ready = asyncio.Event()
+            ready.set()
+            self._ready.append(ready)
+            self._restart_locks.append(asyncio.Lock())
+        logger.info(f"已启动 {self.num_workers} 个工作进程")
+
+    def _spawn(self, index: int, restarts: int = 0) -> _WorkerHandle:
+        parent_conn, child_conn = self.ctx.Pipe()
+        process = self.ctx.Process(
+            target=worker_main,
+            args=(child_conn, self.agent_factory, self.memory_factory, self.max_sessions),
+            name=f"myAgent-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        # 关闭父进程中的子端，工作进程退出时读线程才能收到EOF
+        child_conn.close()
+        handle = _WorkerHandle(index, process, parent_conn, restarts)
+        handle.reader = threading.Thread(target=self._read_loop, args=(handle,), daemon=True)
+        handle.reader.start()
+        return handle
+
+    def _read_loop(self, handle: _WorkerHandle):
+        """读线程：把工作进程的响应转交给事件循环"""
+        while True:
+            try:
+                request_id, ok, result = handle.conn.recv()
+            except (EOFError, OSError):
+                break
+            try:
+                self._loop.call_soon_threadsafe(self._resolve, handle, request_id, ok, result)
+            except RuntimeError:
+                # 事件循环已关闭
+                return
+        try:
+            self._loop.call_soon_threadsafe(self._fail_pending, handle)
+        except RuntimeError:
+            pass
+
+    def _resolve(self, handle: _WorkerHandle, request_id: int, ok: bool, result):
+        future = handle.pending.pop(request_id, None)
+        if future is not None and not future.done():
+            future.set_result((ok, result))
+
+    def _fail_pending(self, handle: _WorkerHandle):
+        handle.closed = True
+        for future in handle.pending.values():
+            if not future.done():
+                future.set_result((False, f"工作进程 {handle.index} 已退出"))
+        handle.pending.clear()
+
+    async def _call(self, handle: _WorkerHandle, op: str, payload=None):
+        """向工作进程发送请求并等待结果"""
+        if handle.closed:
+            raise RuntimeError(f"工作进程 {handle.index} 已退出")
+        request_id = next(self._ids)
+        future = self._loop.create_future()
+        handle.pending[request_id] = future
+        handle.in_flight += 1
+        handle.idle.clear()
+        try:
+            handle.conn.send((request_id, op, payload))
+            ok, result = await future
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"工作进程 {handle.index} 通信失败: {e}")
+        finally:
+            handle.pending.pop(request_id, None)
+            handle.in_flight -= 1
+            if handle.in_flight == 0:
+                handle.idle.set()
+        if not ok:
+            raise RuntimeError(result)
+        return result
+
+    async def run(self, session_id: str, prompt: str):
+        """把请求路由到会话所属的工作进程执行"""
+        index = self.worker_index(session_id)
+        # 工作进程重启期间，新请求在此等待交接完成
+        await self._ready[index].wait()
+        return await self._call(self.workers[index], "run", (session_id, prompt))
+
+    async def restart_worker(self, index: int):
+        """重启指定工作进程，并把会话记忆交接给新进程
+
+        旧进程在 control_timeout 内没有空闲或没有完成导出时，视为卡死，直接终止并放弃交接；
+        会话交接失败时抛出RuntimeError，此时新进程已启动但丢失了旧进程的会话。
+        """
+        # 同一工作进程的重启串行执行，避免产生多个替代进程
+        async with self._restart_locks[index]:
+            ready = self._ready[index]
+            ready.clear()
+            try:
+                old = self.workers[index]
+                snapshot = {}
+                if old.process.is_alive():
+                    try:
+                        await asyncio.wait_for(old.idle.wait(), self.control_timeout)
+                        snapshot = await asyncio.wait_for(self._call(old, "export"), self.control_timeout)
+                    except asyncio.TimeoutError:
+                        logger.warning(f"工作进程 {index} 无响应，强制重启，会话记忆无法交接")
+                    except RuntimeError as e:
+                        logger.warning(f"工作进程 {index} 导出会话失败，会话记忆无法交接: {e}")
+                else:
+                    logger.warning(f"工作进程 {index} 已退出，会话记忆无法交接")
+                await self._stop(old)
+                new = self._spawn(index, old.restarts + 1)
+                self.workers[index] = new
+                if snapshot:
+                    try:
+                        await self._call(new, "import", snapshot)
+                    except Exception as e:
+                        logger.error(f"工作进程 {index} 导入会话失败，丢弃会话 {len(snapshot)} 个: {e}")
+                        raise RuntimeError(
+                            f"工作进程 {index} 已重启，但会话交接失败，丢弃会话 {len(snapshot)} 个: {e}"
+                        )
+                logger.info(f"工作进程 {index} 已重启，交接会话 {len(snapshot)} 个")
+            finally:
+                ready.set()
+
+    async def _stop(self, handle: _WorkerHandle, timeout: float = None):
+        if timeout is None:
+            timeout = self.control_timeout
+        if handle.process.is_alive():
+            try:
+                await asyncio.wait_for(self._call(handle, "stop"), timeout)
+            except (RuntimeError, asyncio.TimeoutError):
+                pass
+        await asyncio.to_thread(handle.process.join, timeout)
+        if handle.process.is_alive():
+            handle.process.terminate()
+            await asyncio.to_thread(handle.process.join)
+        handle.conn.close()
+
+    async def _worker_stats(self, index: int, handle: _WorkerHandle) -> dict:
+        info = {
+            "worker": index,
+            "pid": handle.process.pid,
+            "alive": handle.process.is_alive(),
+            "restarts": handle.restarts,
+            "in_flight": handle.in_flight,
+        }
+        if info["alive"] and self._ready[index].is_set():
+            try:
+                info.update(await asyncio.wait_for(self._call(handle, "stats"), self.control_timeout))
+            except asyncio.TimeoutError:
+                info["error"] = f"工作进程 {index} 查询负载超时"
+            except RuntimeError as e:
+                info["error"] = str(e)
+        return info
+
+    async def stats(self) -> list:
+        """返回每个工作进程的负载信息，各进程并发查询"""
+        return list(await asyncio.gather(
+            *(self._worker_stats(index, handle) for index, handle in enumerate(self.workers))
+        ))
+
+    async def shutdown(self):
+        """停止所有工作进程"""
+        await asyncio.gather(*(self._stop(handle) for handle in self.workers))
+        self.workers = []
+        self._ready = []
+        self._restart_locks = []
+        logger.info("所有工作进程已停止")
@@ -1,7 +1,81 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import os
 
-app = FastAPI()
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from agent.memory_manager import MemoryManager, RetrievalMemoryManager
+from api.dispatcher import SessionDispatcher
+from api.worker import SessionHost, default_agent_factory
+
+# 工作进程数，0 表示在当前进程内处理所有会话
+NUM_WORKERS = int(os.getenv("MYAGENT_WORKERS", "0"))
+# 记忆模式：full（完整历史）或 retrieval（BM25 长期记忆）
+MEMORY_FACTORY = RetrievalMemoryManager if os.getenv("MYAGENT_MEMORY", "full") == "retrieval" else MemoryManager
+# 每个进程托管的最大会话数，未设置时不限制
+MAX_SESSIONS = int(os.getenv("MYAGENT_MAX_SESSIONS")) if os.getenv("MYAGENT_MAX_SESSIONS") else None
+
+
+class ChatRequest(BaseModel):
+    session_id: str
+    prompt: str
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.dispatcher = None
+    app.state.host = None
+    if NUM_WORKERS > 0:
+        app.state.dispatcher = SessionDispatcher(
+            NUM_WORKERS,
+            memory_factory=MEMORY_FACTORY,
+            max_sessions=MAX_SESSIONS
+        )
+        await app.state.dispatcher.start()
+    else:
+        app.state.host = SessionHost(default_agent_factory, MEMORY_FACTORY, MAX_SESSIONS)
+    yield
+    if app.state.dispatcher is not None:
+        await app.state.dispatcher.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to myAgent API!"}
+
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    dispatcher = app.state.dispatcher
+    if dispatcher is not None:
+        try:
+            reply = await dispatcher.run(request.session_id, request.prompt)
+        except RuntimeError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        return {
+            "session_id": request.session_id,
+            "worker": dispatcher.worker_index(request.session_id),
+            "reply": reply
+        }
+    reply = await app.state.host.run(request.session_id, request.prompt)
+    return {"session_id": request.session_id, "worker": None, "reply": reply}
+
+@app.get("/workers")
+async def workers():
+    if app.state.dispatcher is not None:
+        return await app.state.dispatcher.stats()
+    return [app.state.host.stats()]
+
+@app.post("/workers/{index}/restart")
+async def restart_worker(index: int):
+    dispatcher = app.state.dispatcher
+    if dispatcher is None:
+        raise HTTPException(status_code=400, detail="未启用多进程模式（MYAGENT_WORKERS=0）")
+    if not 0 <= index < dispatcher.num_workers:
+        raise HTTPException(status_code=404, detail=f"工作进程 {index} 不存在")
+    try:
+        await dispatcher.restart_worker(index)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return (await dispatcher.stats())[index]
@@ -0,0 +1,181 @@
+from collections import OrderedDict
+import asyncio
+import os
+import threading
+
+from agent.agent import ToolCallingAgent
+from agent.llm import LLM
+from agent.memory_manager import MemoryManager
+from agent.tool_manager import ToolManager
+from tool import search_tool, add, terminate
+
+
+def default_agent_factory(memory_manager: MemoryManager) -> ToolCallingAgent:
+    """默认的Agent工厂，每个会话基于自己的MemoryManager创建一个ToolCallingAgent
+
+    工厂函数需要能被pickle（模块级函数），以便传递给spawn出来的工作进程。
+    """
+    llm = LLM(
+        api_key=os.getenv("OPENAI_API_KEY", ""),
+        model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+    )
+    tool_manager = ToolManager()
+    tool_manager.register("search", search_tool)
+    tool_manager.register("add", add)
+    tool_manager.register("terminate", terminate)
+    return ToolCallingAgent(
+        name="myAgent",
+        llm=llm,
+        memory_manager=memory_manager,
+        tool_manager=tool_manager,
+        max_iterations=3
+    )
+
+
+class SessionHost:
+    """在单个进程内托管多个会话的Agent
+
+    特点：
+    - 每个会话拥有独立的MemoryManager
+    - 同一会话的请求串行执行，不同会话并发执行
+    - 支持导出/导入会话记忆，用于工作进程重启时的会话交接
+
+    memory_factory 用于创建每个会话的记忆管理器（如 RetrievalMemoryManager），
+    需要支持以 memory= 传入已有记忆；多进程模式下必须能被pickle。
+    max_sessions 限制托管的会话数，超出时淘汰最久未使用的空闲会话（其记忆随之丢弃）；
+    为 None 时不限制。导出会话时所有会话会打包为一条消息，会话很多时请设置该上限。
+    """
+
+    def __init__(self, agent_factory=default_agent_factory, memory_factory=MemoryManager, max_sessions: int = None):
+        self.agent_factory = agent_factory
+        self.memory_factory = memory_factory
+        self.max_sessions = max_sessions
+        self.agents = OrderedDict()
+        self.locks = {}
+        self.handled = 0
+        self.running = 0
+        self.evicted = 0
+
+    def _get_agent(self, session_id: str):
+        """获取会话对应的Agent，不存在时新建"""
+        agent = self.agents.get(session_id)
+        if agent is None:
+            agent = self._add_session(session_id, self.memory_factory())
+        else:
+            self.agents.move_to_end(session_id)
+        return agent
+
+    def _add_session(self, session_id: str, memory_manager):
+        agent = self.agent_factory(memory_manager)
+        self.agents[session_id] = agent
+        self.agents.move_to_end(session_id)
+        self.locks[session_id] = asyncio.Lock()
+        self._evict()
+        return agent
+
+    def _evict(self):
+        """淘汰最久未使用的空闲会话，直到会话数不超过上限"""
+        if self.max_sessions is None:
+            return
+        for session_id in list(self.agents):
+            if len(self.agents) <= self.max_sessions:
+                break
+            lock = self.locks[session_id]
+            # 正在执行的会话不淘汰；最近新建的会话在末尾，不会被本轮淘汰
+            if lock.locked() or session_id == next(reversed(self.agents)):
+                continue
+            del self.agents[session_id]
+            del self.locks[session_id]
+            self.evicted += 1
+
+    async def run(self, session_id: str, prompt: str):
+        """在指定会话中运行Agent"""
+        agent = self._get_agent(session_id)
+        self.running += 1
+        try:
+            async with self.locks[session_id]:
+                return await agent.run(prompt)
+        finally:
+            self.running -= 1
+            self.handled += 1
+
+    async def export_sessions(self) -> dict:
+        """导出所有会话的记忆，等待各会话正在执行的请求完成"""
+        snapshot = {}
+        for session_id, agent in list(self.agents.items()):
+            async with self.locks[session_id]:
+                snapshot[session_id] = list(agent.memory_manager.get_all())
+        return snapshot
+
+    def import_sessions(self, snapshot: dict):
+        """导入会话记忆，覆盖同名会话"""
+        for session_id, memory in snapshot.items():
+            self._add_session(session_id, self.memory_factory(memory=list(memory)))
+
+    def stats(self) -> dict:
+        """返回当前进程的负载信息"""
+        return {
+            "pid": os.getpid(),
+            "sessions": len(self.agents),
+            "running": self.running,
+            "handled": self.handled,
+            "evicted": self.evicted,
+        }
+
+
+async def _handle(conn, host: SessionHost, request_id: int, op: str, payload):
+    """处理一条来自调度器的请求，并把结果写回管道"""
+    try:
+        if op == "run":
+            result = await host.run(*payload)
+        elif op == "export":
+            result = await host.export_sessions()
+        elif op == "import":
+            host.import_sessions(payload)
+            result = None
+        elif op == "stats":
+            result = host.stats()
+        else:
+            raise ValueError(f"未知操作: {op}")
+        conn.send((request_id, True, result))
+    except Exception as e:
+        conn.send((request_id, False, f"{type(e).__name__}: {e}"))
+
+
+async def _serve(conn, agent_factory, memory_factory, max_sessions):
+    host = SessionHost(agent_factory, memory_factory, max_sessions)
+    loop = asyncio.get_running_loop()
+    inbox = asyncio.Queue()
+
+    def read_pipe():
+        # 使用独立线程读管道，不与LLM/工具调用争用默认线程池
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                message = None
+            loop.call_soon_threadsafe(inbox.put_nowait, message)
+            if message is None or message[1] == "stop":
+                return
+
+    threading.Thread(target=read_pipe, name="pipe-reader", daemon=True).start()
+    tasks = set()
+    while True:
+        message = await inbox.get()
+        if message is None:
+            break
+        request_id, op, payload = message
+        if op == "stop":
+            # 等待正在执行的请求完成后再退出
+            await asyncio.gather(*tasks, return_exceptions=True)
+            conn.send((request_id, True, None))
+            break
+        task = asyncio.create_task(_handle(conn, host, request_id, op, payload))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    conn.close()
+
+
+def worker_main(conn, agent_factory=default_agent_factory, memory_factory=MemoryManager, max_sessions: int = None):
+    """工作进程入口：通过管道接收调度器的请求"""
+    asyncio.run(_serve(conn, agent_factory, memory_factory, max_sessions))
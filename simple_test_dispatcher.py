@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+多进程会话调度测试程序
+使用模拟LLM在本机验证会话亲和路由、重启交接与负载统计
+"""
+
+import asyncio
+import multiprocessing
+import sys
+import time
+from fastapi import HTTPException
+from agent import ToolCallingAgent
+from agent.llm import LLM
+from agent.memory_manager import MemoryManager, RetrievalMemoryManager
+from agent.tool_manager import ToolManager
+from api import main as api_main
+from api.dispatcher import SessionDispatcher
+from api.worker import SessionHost
+from logger import get_logger
+
+logger = get_logger()
+
+failures = []
+
+
+class CountingMockLLM(LLM):
+    """模拟LLM，回复当前收到的消息条数，便于检查会话记忆
+
+    用户消息包含“阻塞”时在线程池中阻塞0.5秒（模拟真实LLM调用），
+    包含“卡住”时阻塞整个工作进程的事件循环（模拟卡死的工作进程）。
+    """
+
+    def __init__(self):
+        super().__init__(api_key="mock-key", model="mock-gpt-3.5-turbo", stream=False)
+
+    async def chat(self, messages, stream=None, **kwargs):
+        last_user_message = messages[-1].get("content", "")
+        if "阻塞" in last_user_message:
+            await asyncio.to_thread(time.sleep, 0.5)
+        elif "卡住" in last_user_message:
+            time.sleep(60)
+        return f"消息数={len(messages)}"
+
+
+def mock_agent_factory(memory_manager):
+    """模块级工厂函数，可被pickle传给工作进程"""
+    return ToolCallingAgent(
+        name="MockAgent",
+        llm=CountingMockLLM(),
+        memory_manager=memory_manager,
+        tool_manager=ToolManager(),
+        max_iterations=3
+    )
+
+
+def broken_memory_factory(memory=None):
+    """导入会话时总是失败的记忆工厂，用于验证交接失败的处理"""
+    if memory:
+        raise ValueError("模拟导入失败")
+    return MemoryManager()
+
+
+def check(condition, message):
+    if condition:
+        print(f"✅ {message}")
+    else:
+        print(f"❌ {message}")
+        failures.append(message)
+
+
+def memory_size(reply):
+    return int(str(reply).split("=")[1])
+
+
+async def test_session_affinity(dispatcher):
+    print("\n--- 测试 1: 会话亲和 ---")
+    replies = [await dispatcher.run("alice", "你好") for _ in range(3)]
+    sizes = [memory_size(r) for r in replies]
+    check(sizes == sorted(sizes) and len(set(sizes)) == 3, f"同一会话的记忆持续增长: {sizes}")
+    stats = await dispatcher.stats()
+    owner = dispatcher.worker_index("alice")
+    check(stats[owner]["handled"] == 3, "同一会话的请求都落在同一个工作进程")
+
+
+async def test_sessions_spread(dispatcher):
+    print("\n--- 测试 2: 会话分布 ---")
+    sessions = [f"user-{i}" for i in range(40)]
+    await asyncio.gather(*(dispatcher.run(s, "你好") for s in sessions))
+    used = {dispatcher.worker_index(s) for s in sessions}
+    check(len(used) == dispatcher.num_workers, f"不同会话分布到所有工作进程: {sorted(used)}")
+    stats = await dispatcher.stats()
+    check(sum(info["sessions"] for info in stats) == 41, "各工作进程的会话数之和正确")
+
+
+async def test_restart_handoff(dispatcher):
+    print("\n--- 测试 3: 重启交接 ---")
+    index = dispatcher.worker_index("alice")
+    before = memory_size(await dispatcher.run("alice", "重启前"))
+    old_pid = dispatcher.workers[index].process.pid
+    # 并发重启同一工作进程应串行执行
+    await asyncio.gather(dispatcher.restart_worker(index), dispatcher.restart_worker(index))
+    after = memory_size(await dispatcher.run("alice", "重启后"))
+    check(after > before, f"重启后会话记忆保留: {before} -> {after}")
+    check(dispatcher.workers[index].process.pid != old_pid, "工作进程已替换")
+    check(dispatcher.workers[index].restarts == 2, "重启次数正确")
+    check(len(multiprocessing.active_children()) == dispatcher.num_workers, "并发重启没有遗留多余进程")
+
+
+async def test_killed_worker(dispatcher):
+    print("\n--- 测试 4: 工作进程被杀死 ---")
+    index = dispatcher.worker_index("bob")
+    dispatcher.workers[index].process.kill()
+    await asyncio.to_thread(dispatcher.workers[index].process.join)
+    try:
+        await asyncio.wait_for(api_main.chat(api_main.ChatRequest(session_id="bob", prompt="你好")), 5)
+        check(False, "工作进程退出后请求应失败")
+    except HTTPException as e:
+        check(e.status_code == 503, f"请求返回503: {e.detail}")
+    except asyncio.TimeoutError:
+        check(False, "工作进程退出后请求不应挂起")
+    await dispatcher.restart_worker(index)
+    check(memory_size(await dispatcher.run("bob", "你好")) == 2, "重启后可以继续服务（会话从头开始）")
+
+
+async def test_workers_endpoint(dispatcher):
+    print("\n--- 测试 5: /workers 负载统计 ---")
+    stats = await api_main.workers()
+    check(len(stats) == dispatcher.num_workers, "返回每个工作进程的统计")
+    keys = {"worker", "pid", "alive", "restarts", "in_flight", "sessions", "running", "handled"}
+    check(all(keys <= set(info) for info in stats), "统计包含负载字段")
+
+
+async def test_retrieval_memory():
+    print("\n--- 测试 6: 长期记忆模式下的交接 ---")
+    dispatcher = SessionDispatcher(1, mock_agent_factory, memory_factory=RetrievalMemoryManager)
+    await dispatcher.start()
+    try:
+        for _ in range(5):
+            await dispatcher.run("carol", "你好")
+        await dispatcher.restart_worker(0)
+        size = memory_size(await dispatcher.run("carol", "你好"))
+        # 完整历史为 1 + 5 * 2 + 1 = 12 条；交接丢失时只有 2 条
+        check(2 < size < 12, f"交接后的历史参与检索，且发送的上下文小于完整历史: {size}")
+    finally:
+        await dispatcher.shutdown()
+
+
+async def test_import_failure():
+    print("\n--- 测试 7: 会话交接失败 ---")
+    dispatcher = SessionDispatcher(1, mock_agent_factory, memory_factory=broken_memory_factory)
+    await dispatcher.start()
+    try:
+        await dispatcher.run("dave", "你好")
+        try:
+            await dispatcher.restart_worker(0)
+            check(False, "交接失败应抛出RuntimeError")
+        except RuntimeError as e:
+            check("丢弃会话 1 个" in str(e), f"交接失败返回明确错误: {e}")
+        check(memory_size(await dispatcher.run("dave", "你好")) == 2, "交接失败后新进程仍可服务")
+    finally:
+        await dispatcher.shutdown()
+
+
+async def test_busy_worker():
+    print("\n--- 测试 9: 线程池占满时仍能接收请求 ---")
+    dispatcher = SessionDispatcher(1, mock_agent_factory)
+    await dispatcher.start()
+    try:
+        await dispatcher.run("warmup", "你好")
+        tasks = [asyncio.create_task(dispatcher.run(f"busy-{i}", "阻塞")) for i in range(80)]
+        await asyncio.sleep(0.3)
+        start = time.perf_counter()
+        stats = await dispatcher.stats()
+        elapsed = time.perf_counter() - start
+        check(elapsed < 0.1, f"负载查询耗时 {elapsed:.3f}s")
+        check(stats[0]["running"] == 80, f"工作进程已接收全部请求: running={stats[0]['running']}")
+        await asyncio.gather(*tasks)
+    finally:
+        await dispatcher.shutdown()
+
+
+async def test_hung_worker():
+    print("\n--- 测试 10: 卡死的工作进程 ---")
+    dispatcher = SessionDispatcher(2, mock_agent_factory, control_timeout=1)
+    await dispatcher.start()
+    try:
+        index = dispatcher.worker_index("eve")
+        # 先让两个工作进程都完成启动
+        await asyncio.gather(*(dispatcher.run(f"warmup-{i}", "你好") for i in range(8)))
+        hung = asyncio.create_task(dispatcher.run("eve", "卡住"))
+        await asyncio.sleep(0.3)
+        start = time.perf_counter()
+        stats = await dispatcher.stats()
+        elapsed = time.perf_counter() - start
+        check(elapsed < 2, f"负载查询不被卡死的进程拖住: {elapsed:.3f}s")
+        check("error" in stats[index] and "error" not in stats[1 - index], "只有卡死的进程报告错误")
+        start = time.perf_counter()
+        await dispatcher.restart_worker(index)
+        elapsed = time.perf_counter() - start
+        check(elapsed < 5, f"卡死的进程被强制重启: {elapsed:.3f}s")
+        try:
+            await asyncio.wait_for(hung, 1)
+            check(False, "卡住的请求应失败")
+        except RuntimeError:
+            check(True, "卡住的请求返回RuntimeError")
+        check(memory_size(await dispatcher.run("eve", "你好")) == 2, "重启后可以继续服务")
+    finally:
+        await dispatcher.shutdown()
+
+
+async def test_session_limit():
+    print("\n--- 测试 8: 会话数上限 ---")
+    host = SessionHost(mock_agent_factory, max_sessions=2)
+    for session_id in ["s1", "s2", "s1", "s3"]:
+        await host.run(session_id, "你好")
+    check(list(host.agents) == ["s1", "s3"], f"淘汰最久未使用的会话: {list(host.agents)}")
+    check(host.stats()["evicted"] == 1, "统计淘汰次数")
+
+
+async def test_dispatcher():
+    """测试SessionDispatcher的多进程会话调度"""
+
+    print("=== SessionDispatcher 多进程调度测试 ===")
+    print("使用模拟LLM，所有工作进程运行在本机\n")
+
+    dispatcher = SessionDispatcher(3, mock_agent_factory)
+    await dispatcher.start()
+    api_main.app.state.dispatcher = dispatcher
+    try:
+        await test_session_affinity(dispatcher)
+        await test_sessions_spread(dispatcher)
+        await test_restart_handoff(dispatcher)
+        await test_killed_worker(dispatcher)
+        await test_workers_endpoint(dispatcher)
+    finally:
+        await dispatcher.shutdown()
+        api_main.app.state.dispatcher = None
+
+    await test_retrieval_memory()
+    await test_import_failure()
+    await test_session_limit()
+    await test_busy_worker()
+    await test_hung_worker()
+
+    print("\n--- 测试 11: 关闭 ---")
+    check(not multiprocessing.active_children(), "shutdown后没有遗留子进程")
+
+    print("\n=== 测试完成 ===")
+    if failures:
+        logger.error(f"{len(failures)} 个检查失败")
+        sys.exit(1)
+    print("所有测试用例执行完毕。")
+
+if __name__ == "__main__":
+    asyncio.run(test_dispatcher())
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+长期记忆测试程序
+验证RetrievalMemoryManager的索引与上下文选择，并用ToolCallingAgent格式的长会话测量查询耗时
+"""
+
+import asyncio
+import random
+import sys
+import time
+from agent import ToolCallingAgent
+from agent.llm import LLM
+from agent.memory_manager import RetrievalMemoryManager, TOOL_CALL_PREFIX, TOOL_RESULT_PREFIX, tokenize
+from agent.tool_manager import ToolManager
+from tool import add
+from logger import get_logger
+
+logger = get_logger()
+
+failures = []
+
+TOPICS = [
+    "python", "java", "rust", "golang", "kubernetes", "docker", "redis", "mysql", "fastapi", "pydantic",
+    "机器学习", "深度学习", "数据库", "编译器", "操作系统", "网络协议", "分布式", "搜索引擎", "推荐系统", "前端框架",
+]
+
+
+class ContextMockLLM(LLM):
+    """模拟LLM，记录每次收到的消息条数，按THINK/ACT格式响应"""
+
+    def __init__(self):
+        super().__init__(api_key="mock-key", model="mock-gpt-3.5-turbo", stream=False)
+        self.sizes = []
+
+    async def chat(self, messages, stream=None, **kwargs):
+        self.sizes.append(len(messages))
+        last_user_message = messages[-1].get("content", "")
+        if "工具执行结果" in last_user_message:
+            return "计算完成！"
+        return "THINK: 用户要求进行计算，我需要使用add工具。\nACT: add 15 27"
+
+
+class LoopingMockLLM(LLM):
+    """模拟LLM，始终调用工具，记录每次收到的上下文"""
+
+    def __init__(self):
+        super().__init__(api_key="mock-key", model="mock-gpt-3.5-turbo", stream=False)
+        self.contexts = []
+
+    async def chat(self, messages, stream=None, **kwargs):
+        self.contexts.append(list(messages))
+        return "THINK: 还需要继续计算。\nACT: add 1 2"
+
+
+def check(condition, message):
+    if condition:
+        print(f"✅ {message}")
+    else:
+        print(f"❌ {message}")
+        failures.append(message)
+
+
+def agent_turn(topic: str, number: int) -> list:
+    """生成一轮与ToolCallingAgent写入格式一致的消息"""
+    return [
+        {"role": "user", "content": f"请帮我搜索 {topic} 的资料，编号 {number}"},
+        {"role": "assistant", "content": f"THINK: 用户想要搜索{topic}相关的信息，我需要使用search工具来查找相关内容。"},
+        {"role": "assistant", "content": f"ACT: search {topic}"},
+        {"role": "user", "content": f"工具执行结果: 工具 'search' 执行结果: ['{topic} 的介绍', '{topic} 的教程']"},
+        {"role": "assistant", "content": f"我已经找到了包含'{topic}'的信息，这是第 {number} 次查询的结果。"},
+    ]
+
+
+def test_indexing():
+    print("\n--- 测试 1: 构造时建立索引与清空 ---")
+    memory = [{"role": "system", "content": "系统提示词"}]
+    memory += agent_turn("python", 1) + agent_turn("java", 2)
+    manager = RetrievalMemoryManager(memory=memory, recent_messages=2)
+    check(manager.search("java", top_k=1)[0] in range(6, 11), "构造时传入的消息已建立索引")
+    manager.clear()
+    check(manager.memory == [] and manager.search("java") == [], "clear() 清空记忆和索引")
+
+
+def test_context_order():
+    print("\n--- 测试 2: 上下文的组成与顺序 ---")
+    manager = RetrievalMemoryManager(recent_messages=3, top_k=2)
+    manager.add({"role": "system", "content": "系统提示词"})
+    for number, topic in enumerate(["python", "java", "rust", "docker"]):
+        for message in agent_turn(topic, number):
+            manager.add(message)
+    context = manager.get_context("rust")
+    check(context[0]["role"] == "system", "系统提示词位于最前")
+    check(context[-3:] == manager.memory[-3:], "保留最后 recent_messages 条消息")
+    positions = [manager.memory.index(message) for message in context]
+    check(positions == sorted(positions), "消息保持原有顺序")
+    check(any("rust" in message["content"] for message in context[1:-3]), "检索到相关的较早消息")
+
+
+def test_tool_pairs():
+    print("\n--- 测试 3: 工具调用与执行结果成对返回 ---")
+    manager = RetrievalMemoryManager(recent_messages=2, top_k=1)
+    manager.add({"role": "system", "content": "系统提示词"})
+    for number, topic in enumerate(["python", "redis", "java"]):
+        for message in agent_turn(topic, number):
+            manager.add(message)
+    for query in ["search redis", "redis 的教程"]:
+        context = manager.get_context(query)
+        paired = all(
+            context[i + 1]["content"].startswith("工具执行结果")
+            for i, m in enumerate(context) if m["content"].startswith("ACT:")
+        ) and all(
+            i > 0 and context[i - 1]["content"].startswith("ACT:")
+            for i, m in enumerate(context) if m["content"].startswith("工具执行结果")
+        )
+        check(paired and {"role": "assistant", "content": "ACT: search redis"} in context,
+              f"查询 '{query}' 返回完整的工具调用")
+    manager = RetrievalMemoryManager(recent_messages=1, top_k=0)
+    for message in agent_turn("python", 0)[:4]:
+        manager.add(message)
+    check(manager.get_context("python")[-2]["content"].startswith("ACT:"), "最近消息不会从执行结果中间截断")
+
+
+def test_cjk():
+    print("\n--- 测试 4: 中文二字匹配 ---")
+    check(tokenize("机器学习") == ["机器", "器学", "学习"], "中文按相邻二字切分")
+    manager = RetrievalMemoryManager(recent_messages=0, top_k=1)
+    for content in ["我喜欢操作系统", "今天学习机器学习", "数据库索引很重要"]:
+        manager.add({"role": "user", "content": content})
+    check(manager.search("机器学习入门") == [1], "中文查询命中相关消息")
+
+
+async def test_agent_context():
+    print("\n--- 测试 5: ToolCallingAgent 发送较小的上下文 ---")
+    llm = ContextMockLLM()
+    tool_manager = ToolManager()
+    tool_manager.register("add", lambda a, b: add(int(a), int(b)))
+    agent = ToolCallingAgent(
+        name="MemoryAgent",
+        llm=llm,
+        memory_manager=RetrievalMemoryManager(recent_messages=4, top_k=2),
+        tool_manager=tool_manager,
+        max_iterations=3
+    )
+    for _ in range(10):
+        await agent.run("计算 15 + 27")
+    total = len(agent.memory_manager.memory)
+    memory = agent.memory_manager.memory
+    pairs = [
+        (memory[i], memory[i + 1]) for i in range(len(memory) - 1)
+        if memory[i]["content"].startswith(TOOL_CALL_PREFIX)
+    ]
+    check(pairs and all(result["content"].startswith(TOOL_RESULT_PREFIX) for _, result in pairs),
+          f"Agent写入的工具调用与执行结果使用共享的前缀: {len(pairs)} 对")
+    check(max(llm.sizes) <= 1 + 2 * 2 + 5 < total, f"每次发送的消息数受限: 最多 {max(llm.sizes)} 条，完整历史 {total} 条")
+
+
+async def test_prompt_kept():
+    print("\n--- 测试 6: 多轮工具调用中始终保留用户问题 ---")
+    for prompt in ["？？", "执行结果 think", "计算 1 + 2"]:
+        llm = LoopingMockLLM()
+        tool_manager = ToolManager()
+        tool_manager.register("add", lambda a, b: add(int(a), int(b)))
+        agent = ToolCallingAgent(
+            name="LoopingAgent",
+            llm=llm,
+            memory_manager=RetrievalMemoryManager(top_k=2),
+            tool_manager=tool_manager,
+            max_iterations=5
+        )
+        # 同一个问题之前已经问过多次
+        for _ in range(3):
+            agent.memory_manager.add({"role": "user", "content": prompt})
+            agent.memory_manager.add({"role": "assistant", "content": "好的"})
+        await agent.run(prompt)
+        current = agent.memory_manager.memory[7]
+        kept = all(any(message is current for message in context) for context in llm.contexts)
+        check(len(llm.contexts) == 5 and kept, f"问题 '{prompt}' 在 {len(llm.contexts)} 次迭代中都被发送")
+
+
+def test_benchmark():
+    print("\n--- 测试 7: 3万条消息的增量索引与查询耗时 ---")
+    random.seed(0)
+    manager = RetrievalMemoryManager()
+    manager.add({"role": "system", "content": "系统提示词"})
+    messages = []
+    for number in range(6000):
+        messages.extend(agent_turn(random.choice(TOPICS), number))
+    start = time.perf_counter()
+    for message in messages:
+        manager.add(message)
+    add_ms = (time.perf_counter() - start) / len(messages) * 1000
+    check(add_ms < 1, f"每条消息索引耗时 {add_ms:.4f} ms")
+    for query in ["search python", "请帮我搜索 python 的结果", "调用工具搜索", "第 4242 次查询", "机器学习的教程"]:
+        rounds = 200
+        start = time.perf_counter()
+        for _ in range(rounds):
+            manager.get_context(query)
+        query_ms = (time.perf_counter() - start) / rounds * 1000
+        check(query_ms < 1, f"查询 '{query}' 耗时 {query_ms:.3f} ms")
+
+
+async def test_retrieval_memory():
+    """测试RetrievalMemoryManager的长期记忆"""
+
+    print("=== RetrievalMemoryManager 长期记忆测试 ===")
+
+    test_indexing()
+    test_context_order()
+    test_tool_pairs()
+    test_cjk()
+    await test_agent_context()
+    await test_prompt_kept()
+    test_benchmark()
+
+    print("\n=== 测试完成 ===")
+    if failures:
+        logger.error(f"{len(failures)} 个检查失败")
+        sys.exit(1)
+    print("所有测试用例执行完毕。")
+
+if __name__ == "__main__":
+    asyncio.run(test_retrieval_memory())
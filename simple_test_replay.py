@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+录制/回放LLM测试程序
+用模拟的流式输出录制ToolCallingAgent的一次运行，再在无网络的情况下回放
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import openai
+from agent import ToolCallingAgent
+from agent.memory_manager import MemoryManager
+from agent.replay_llm import Cassette, ReplayLLM, split_chunks
+from agent.tool_manager import ToolManager
+from tool import add
+from logger import get_logger
+
+logger = get_logger()
+
+failures = []
+
+
+class StubRecordingLLM(ReplayLLM):
+    """录制模式下用固定的分块代替真实的流式请求"""
+
+    def __init__(self, cassette, replies=None):
+        super().__init__(cassette, mode="record", api_key="mock-key")
+        self.replies = replies
+        self.calls = 0
+
+    def _stream_deltas(self, messages, **kwargs):
+        self.calls += 1
+        if self.replies is not None:
+            yield self.replies[self.calls - 1]
+            return
+        last_user_message = messages[-1].get("content", "")
+        time.sleep(0.1)
+        if "工具执行结果" in last_user_message:
+            yield "计算完成！"
+            time.sleep(0.05)
+            yield "15 + 27 = 42。"
+        else:
+            yield "THINK: 用户要求进行计算，我需要使用add工具。\n"
+            time.sleep(0.05)
+            yield "ACT: add 15 27"
+
+
+def no_network(*args, **kwargs):
+    raise AssertionError("回放时不应访问网络")
+
+
+def check(condition, message):
+    if condition:
+        print(f"✅ {message}")
+    else:
+        print(f"❌ {message}")
+        failures.append(message)
+
+
+def create_agent(llm):
+    tool_manager = ToolManager()
+    tool_manager.register("add", lambda a, b: add(int(a), int(b)))
+    return ToolCallingAgent(
+        name="ReplayAgent",
+        llm=llm,
+        memory_manager=MemoryManager(),
+        tool_manager=tool_manager,
+        max_iterations=3
+    )
+
+
+async def test_record_and_replay(path):
+    print("\n--- 测试 1: 录制并回放 ToolCallingAgent ---")
+    recorder = StubRecordingLLM(path)
+    agent = create_agent(recorder)
+    recorded = await agent.run("计算 15 + 27 的结果")
+    check(recorder.calls == 2 and len(recorder.cassette) == 2, "录制了两次交互（思考 + 基于工具结果回复）")
+    record = Cassette(path).get(next(iter(recorder.cassette.index)))
+    check(all(isinstance(length, int) for _, length in record["chunks"]), "分块只保存时间和长度，响应不重复存储")
+    check("".join(text for _, text in split_chunks(record)) == record["response"], "可以由响应还原分块内容")
+
+    api_key = openai.api_key
+    original_create = openai.chat.completions.create
+    openai.chat.completions.create = no_network
+    try:
+        replies = []
+        memories = []
+        for _ in range(2):
+            # 每次回放使用新的录制带实例，游标从头开始
+            agent = create_agent(ReplayLLM(path))
+            replies.append(await agent.run("计算 15 + 27 的结果"))
+            memories.append(agent.memory_manager.get_all())
+    finally:
+        openai.chat.completions.create = original_create
+    check(openai.api_key == api_key, "回放模式不修改全局 openai.api_key")
+    check(replies == [recorded, recorded], f"回放结果与录制一致: {replies[0]}")
+    check(memories[0] == memories[1], "两次回放的对话记忆完全相同")
+
+
+async def test_duplicate_keys(path):
+    print("\n--- 测试 2: 相同请求的回放顺序 ---")
+    messages = [{"role": "user", "content": "你好"}]
+    recorder = StubRecordingLLM(path, replies=["第一次", "第二次"])
+    await recorder.chat(messages)
+    await recorder.chat(messages)
+    llm = ReplayLLM(path)
+    replies = [await llm.chat(messages) for _ in range(3)]
+    check(replies == ["第一次", "第二次", "第二次"], f"按录制顺序回放，最后一条重复使用: {replies}")
+
+
+async def test_cassette_miss(path):
+    print("\n--- 测试 3: 录制带未命中 ---")
+    llm = ReplayLLM(path)
+    try:
+        await llm.chat([{"role": "user", "content": "没有录制过的问题"}])
+        check(False, "未命中时应抛出KeyError")
+    except KeyError:
+        check(True, "未命中时抛出KeyError")
+
+
+async def test_realtime(path):
+    print("\n--- 测试 4: 按录制时间回放 ---")
+    recorded = sum(delay_ms for delay_ms, _ in Cassette(path).get(next(iter(Cassette(path).index)))["chunks"]) / 1000
+    for stream in (True, False):
+        llm = ReplayLLM(path, realtime=True)
+        messages = create_agent(llm).memory_manager.get_all()
+        messages.append({"role": "user", "content": "计算 15 + 27 的结果"})
+        start = time.perf_counter()
+        await llm.chat(messages, stream=stream)
+        elapsed = time.perf_counter() - start
+        check(recorded * 0.8 <= elapsed <= recorded * 1.5 + 0.05,
+              f"stream={stream} 回放耗时 {elapsed:.3f}s，录制耗时 {recorded:.3f}s")
+
+
+async def test_partial_line(path):
+    print("\n--- 测试 5: 写入中断后继续录制 ---")
+    messages = [{"role": "user", "content": "第一个问题"}]
+    recorder = StubRecordingLLM(path, replies=["回复一"])
+    await recorder.chat(messages)
+    # 模拟写入中途崩溃留下的半行
+    with open(path, "ab") as out:
+        out.write('0123456789abcdef\t{"response":"半'.encode("utf-8"))
+    recorder = StubRecordingLLM(path, replies=["回复二"])
+    await recorder.chat([{"role": "user", "content": "第二个问题"}])
+    check(recorder.cassette.get(next(reversed(recorder.cassette.index)))["response"] == "回复二", "新记录的内存偏移有效")
+    reloaded = Cassette(path)
+    check(len(reloaded) == 2, f"重新加载后记录完整: {len(reloaded)} 条")
+    llm = ReplayLLM(path)
+    replies = [await llm.chat(messages), await llm.chat([{"role": "user", "content": "第二个问题"}])]
+    check(replies == ["回复一", "回复二"], f"半行被截掉，前后记录都能回放: {replies}")
+
+
+async def test_replay_llm():
+    """测试ReplayLLM的录制与回放"""
+
+    print("=== ReplayLLM 录制/回放测试 ===")
+    print("使用模拟的流式输出录制，回放时禁止网络访问\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        agent_path = os.path.join(tmp, "agent.cas")
+        await test_record_and_replay(agent_path)
+        await test_duplicate_keys(os.path.join(tmp, "duplicate.cas"))
+        await test_cassette_miss(agent_path)
+        await test_realtime(agent_path)
+        await test_partial_line(os.path.join(tmp, "partial.cas"))
+
+    print("\n=== 测试完成 ===")
+    if failures:
+        logger.error(f"{len(failures)} 个检查失败")
+        sys.exit(1)
+    print("所有测试用例执行完毕。")
+
+if __name__ == "__main__":
+    asyncio.run(test_replay_llm())